@@ -1,221 +1,817 @@
 import os
+import re
+import json
+import time
+import random
+import queue
+import atexit
+import asyncio
 import logging
-from telegram import Update, ChatMember
-from telegram.ext import Application, CommandHandler, ContextTypes, ChatMemberHandler
+import logging.handlers
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Optional
+import httpx
+from telegram import Bot, Update, ChatMember
+from telegram.error import BadRequest, NetworkError, TelegramError
+from telegram.request import HTTPXRequest
+from telegram.ext import AIORateLimiter, Application, ContextTypes, ChatMemberHandler, MessageHandler, filters
 
-# Try to import supabase
+# Try to import asyncpg for direct Postgres access
 try:
-    from supabase import create_client, Client
-    supabase_available = True
+    import asyncpg
+    asyncpg_available = True
 except ImportError:
-    supabase_available = False
+    asyncpg_available = False
 
-# Configure logging
+# Try to import uvloop for a faster event loop
+try:
+    import uvloop
+    uvloop_available = True
+except ImportError:
+    uvloop_available = False
+
+# Try to import orjson for faster JSON decoding
+try:
+    import orjson
+    orjson_available = True
+except ImportError:
+    orjson_available = False
+
+def channel_id_from_env(var: str):
+    """Read a channel id from the environment as an int, or None if unset"""
+    value = os.environ.get(var)
+    return int(value) if value else None
+
+@dataclass(frozen=True, slots=True)
+class Config:
+    """Settings read once from the environment at startup"""
+    bot_token: Optional[str]
+    supabase_url: Optional[str]
+    supabase_key: Optional[str]
+    supabase_db_url: Optional[str]
+    channel_49_299: Optional[int]
+    channel_79_399: Optional[int]
+    webhook_url: Optional[str]
+    webhook_secret: Optional[str]
+    port: int
+    log_level: str
+    subscription_cache_ttl: int
+    subscription_negative_cache_ttl: int
+    
+    @classmethod
+    def from_env(cls):
+        """Build the config from environment variables"""
+        # Public base URL for webhook delivery, e.g. behind nginx or
+        # Cloudflare; defaults to the Railway domain when deployed there
+        railway_domain = os.environ.get('RAILWAY_PUBLIC_DOMAIN')
+        webhook_url = os.environ.get('WEBHOOK_URL') or (
+            f"https://{railway_domain}" if railway_domain else None
+        )
+        return cls(
+            bot_token=os.environ.get('TELEGRAM_BOT_TOKEN'),
+            supabase_url=os.environ.get('SUPABASE_URL'),
+            supabase_key=os.environ.get('SUPABASE_KEY'),
+            supabase_db_url=os.environ.get('SUPABASE_DB_URL'),
+            channel_49_299=channel_id_from_env('CHANNEL_49_299_ID'),
+            channel_79_399=channel_id_from_env('CHANNEL_79_399_ID'),
+            webhook_url=webhook_url.rstrip('/') if webhook_url else None,
+            webhook_secret=os.environ.get('WEBHOOK_SECRET'),
+            port=int(os.environ.get('PORT', '8443')),
+            log_level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
+            subscription_cache_ttl=int(os.environ.get('SUBSCRIPTION_CACHE_TTL', '300')),
+            subscription_negative_cache_ttl=int(os.environ.get('SUBSCRIPTION_NEGATIVE_CACHE_TTL', '10'))
+        )
+    
+    def missing(self):
+        """Return the names of required environment variables that are unset"""
+        required = {
+            'TELEGRAM_BOT_TOKEN': self.bot_token,
+            'CHANNEL_49_299_ID': self.channel_49_299,
+            'CHANNEL_79_399_ID': self.channel_79_399
+        }
+        return [var for var, value in required.items() if not value]
+
+CONFIG = Config.from_env()
+
+# Configure logging. Handlers only enqueue records; a background listener
+# thread (started in main) does the blocking stream writes. Set LOG_LEVEL
+# (e.g. WARNING) to silence per-event logs in production.
+log_queue = queue.SimpleQueue()
+log_stream_handler = logging.StreamHandler()
+log_stream_handler.setFormatter(
+    logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+)
+log_listener = logging.handlers.QueueListener(log_queue, log_stream_handler)
 logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
+    handlers=[logging.handlers.QueueHandler(log_queue)],
+    level=CONFIG.log_level
 )
 logger = logging.getLogger(__name__)
 
-# Get environment variables
-BOT_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN')
-SUPABASE_URL = os.environ.get('SUPABASE_URL')
-SUPABASE_KEY = os.environ.get('SUPABASE_KEY')
-CHANNEL_49_299 = os.environ.get('CHANNEL_49_299_ID')
-CHANNEL_79_399 = os.environ.get('CHANNEL_79_399_ID')
+# Database clients, opened in post_init. The asyncpg pool is used when
+# SUPABASE_DB_URL is set; otherwise a single HTTP/2 client talks to Supabase's
+# PostgREST API. Both are process-wide singletons that keep connections alive
+# between queries, so they must never be recreated per request.
+db_pool = None
+supabase_http = None
+
+# Payment amount mapping to channels (read-only)
+PAYMENT_CHANNELS = MappingProxyType({
+    '49': CONFIG.channel_49_299,
+    '299': CONFIG.channel_49_299,
+    '79': CONFIG.channel_79_399,
+    '399': CONFIG.channel_79_399
+})
+PAYMENT_AMOUNTS = list(PAYMENT_CHANNELS)
+
+# Channels the bot guards, and the member status changes that count as a join
+VALID_CHANNELS = frozenset(c for c in (CONFIG.channel_49_299, CONFIG.channel_79_399) if c)
+CHANNEL_NAMES = {CONFIG.channel_49_299: "49/299", CONFIG.channel_79_399: "79/399"}
+JOIN_OLD_STATUSES = frozenset(("left", "kicked", "restricted", "banned"))
+JOIN_NEW_STATUSES = frozenset(("member",))
+JOIN_TRANSITIONS = frozenset(
+    (old, new) for old in JOIN_OLD_STATUSES for new in JOIN_NEW_STATUSES
+)
+
+# Fire-and-forget tasks, referenced here so they are not garbage collected
+_background_tasks = set()
+
+# Joins waiting out the debounce window: (chat_id, user_id) -> task.
+# At most JOIN_WORKERS subscription lookups run at once; the rest queue up.
+# Bans and unbans are made outside the slots so that calls held back by the
+# rate limiter never stall other joins.
+JOIN_DEBOUNCE_SECONDS = 0.5
+JOIN_WORKERS = 8
+_pending_joins = {}
+_join_slots = asyncio.Semaphore(JOIN_WORKERS)
+
+# Channel admin cache: channel_id -> (fetched_at, admin user ids)
+ADMIN_CACHE_TTL = 300
+_admin_cache = {}
+
+# Invite links created by /invite: channel_id -> (reuse_until, link). One link
+# per channel is shared by all invites - joins are verified anyway - and
+# replaced an hour before Telegram expires it.
+INVITE_LINK_LIFETIME = 24 * 3600
+INVITE_CACHE_TTL = 23 * 3600
+_invite_cache = {}
+
+# Outgoing Bot API requests time out after BOT_CALL_TIMEOUT seconds on the
+# wire and are retried on transient network errors up to BOT_CALL_TRIES times.
+# Time spent queued in AIORateLimiter is deliberately not bounded.
+BOT_CALL_TIMEOUT = 10
+BOT_CALL_TRIES = 3
+
+# Command reply texts, built once at import. *_TMPL are pre-bound
+# str.format methods called with the template fields.
+ADMINS_ONLY_MSG = "❌ Admins only."
+APPROVE_USAGE_MSG = "Reply to a user's message with /approve"
+APPROVED_TMPL = "✅ User @{username} approved.".format
+ERROR_TMPL = "Error: {error}".format
+INVITE_USAGE_MSG = "Use: /invite @username"
+INVITE_TMPL = "✅ Invite for @{username}: {link}".format
+INVITE_ERROR_MSG = "Error generating invite."
+NO_SUBSCRIPTION_TMPL = "❌ No subscription found for @{username}.".format
+ACTIVE_SUBSCRIPTION_TMPL = "✅ Active subscription! (₹{amount}) for {channel} channel.".format
+NO_ACTIVE_SUBSCRIPTION_MSG = "❌ No active subscription found."
+CHECK_ERROR_MSG = "Error checking subscription."
+
+# Telegram usernames; anything else passed to /invite is rejected before it
+# reaches a query
+USERNAME_RE = re.compile(r"^[A-Za-z0-9_]{4,32}$")
+
+# Only request the update types the handlers consume from Telegram
+ALLOWED_UPDATES = [Update.CHAT_MEMBER, Update.MESSAGE]
+
+# Subscription lookup cache: (user_id, lowercased username) -> (expires_at, result).
+# Negative results expire quickly so newly paid users are not locked out.
+SUBSCRIPTION_CACHE_TTL = CONFIG.subscription_cache_ttl
+SUBSCRIPTION_NEGATIVE_CACHE_TTL = CONFIG.subscription_negative_cache_ttl
+SUBSCRIPTION_CACHE_SIZE = 1000
+SUBSCRIPTION_QUERY_TIMEOUT = 5
+_subscription_cache = {}
+_subscription_inflight = {}
+
+# Opening the Postgres pool at startup is retried this many times before the
+# bot exits and leaves the restart to the platform
+DB_CONNECT_TRIES = 5
+
+# Lookup result when Supabase could not be asked (timeout or error): the
+# subscription status is unknown, which is not the same as "not found"
+SUBSCRIPTION_UNKNOWN = (None, None, None)
+
+def subscription_cache_key(user_id: int, username: Optional[str]):
+    """Cache key for a lookup: the user id with the lowercased username"""
+    return user_id, username.lower() if username else None
+
+def invalidate_subscription_cache(user_id: int, username: Optional[str]):
+    """Drop any cached subscription result for a user"""
+    _subscription_cache.pop(subscription_cache_key(user_id, username), None)
+
+def _cached_subscription(key):
+    """Return a fresh cached subscription result, or None"""
+    cached = _subscription_cache.get(key)
+    if cached and time.monotonic() < cached[0]:
+        return cached[1]
+    return None
+
+async def check_user_subscription(user_id: int, username: Optional[str]):
+    """Check if user has a valid subscription, served from cache when fresh"""
+    if not db_pool and not supabase_http:
+        return True, "49", CONFIG.channel_49_299
+    
+    key = subscription_cache_key(user_id, username)
+    result = _cached_subscription(key)
+    if result is not None:
+        return result
+    
+    # Single-flight: concurrent lookups for the same user await the query
+    # already in progress instead of issuing their own
+    inflight = _subscription_inflight.get(key)
+    if inflight:
+        return await asyncio.shield(inflight)
+    
+    future = asyncio.get_running_loop().create_future()
+    _subscription_inflight[key] = future
+    try:
+        result = await _lookup_subscription(key, user_id, username)
+    except BaseException:
+        future.cancel()
+        raise
+    finally:
+        del _subscription_inflight[key]
+    future.set_result(result)
+    return result
 
-# Initialize Supabase client
-supabase_client = None
-if supabase_available and SUPABASE_URL and SUPABASE_KEY:
+async def _lookup_subscription(key, user_id: int, username: Optional[str]):
+    """Look up a subscription in Supabase and cache the result"""
     try:
-        supabase_client = create_client(SUPABASE_URL, SUPABASE_KEY)
-        logger.info("Supabase client initialized")
+        async with asyncio.timeout(SUBSCRIPTION_QUERY_TIMEOUT):
+            result = await subscription_batcher.lookup(user_id, username)
+    except TimeoutError:
+        # Not cached, so the next event retries
+        logger.warning("Subscription lookup for %s timed out", key)
+        return SUBSCRIPTION_UNKNOWN
     except Exception as e:
-        logger.error(f"Failed to initialize Supabase client: {e}")
-        supabase_client = None
-
-# Payment amount mapping to channels
-PAYMENT_CHANNELS = {
-    '49': CHANNEL_49_299,
-    '299': CHANNEL_49_299,
-    '79': CHANNEL_79_399,
-    '399': CHANNEL_79_399
-}
+        # Transient failures are not cached so the next event retries
+        logger.error("Error checking subscription: %s", e)
+        return SUBSCRIPTION_UNKNOWN
+    
+    ttl = SUBSCRIPTION_CACHE_TTL if result[0] else SUBSCRIPTION_NEGATIVE_CACHE_TTL
+    _subscription_cache.pop(key, None)
+    if len(_subscription_cache) >= SUBSCRIPTION_CACHE_SIZE:
+        # Evict the oldest entry (dicts keep insertion order)
+        _subscription_cache.pop(next(iter(_subscription_cache)))
+    _subscription_cache[key] = (time.monotonic() + ttl, result)
+    return result
 
-async def check_user_subscription(user_id: int, username: str):
-    """Check if user has a valid subscription"""
-    if not supabase_client:
-        return True, "49", CHANNEL_49_299
+class SubscriptionBatcher:
+    """Coalesces lookups arriving within a short window into one query"""
     
-    try:
-        response = supabase_client.table("subscriptions") \
-            .select("amount_paid, payment_status, is_active, telegram_username") \
-            .ilike("telegram_username", f"%{username}%") \
-            .eq("payment_status", "completed") \
-            .eq("is_active", True) \
-            .execute()
+    def __init__(self, max_batch: int = 50, max_wait: float = 0.03):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = asyncio.Queue()
+        self._task = None
+    
+    def start(self):
+        """Start collecting batches on the running event loop"""
+        self._task = asyncio.get_running_loop().create_task(self._run())
+    
+    async def stop(self):
+        """Stop collecting batches"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+    
+    async def lookup(self, user_id: int, username: Optional[str]):
+        """Queue one lookup and wait for its batch to be answered"""
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((user_id, username, future))
+        return await future
+    
+    async def _run(self):
+        """Collect queued lookups into batches and hand each one off"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except TimeoutError:
+                    break
+            # Batches are answered concurrently; collection carries on
+            spawn_background(self._answer(batch))
+    
+    async def _answer(self, batch):
+        """Run one batch query and resolve the futures waiting on it"""
+        try:
+            results = await fetch_subscriptions([(user_id, username) for user_id, username, _ in batch])
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
         
-        if response.data:
-            subscription = response.data[0]
-            amount = str(subscription['amount_paid'])
-            
-            if amount in PAYMENT_CHANNELS:
-                channel_id = PAYMENT_CHANNELS[amount]
-                return True, amount, channel_id
-            
-            return False, amount, None
-                
-        return False, None, None
+        for (_, _, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+subscription_batcher = SubscriptionBatcher()
+
+async def fetch_subscriptions(lookups):
+    """Query Supabase for the subscriptions of several (user_id, username) pairs"""
+    # Usernames are unique and case-insensitive: match exactly against the
+    # generated, indexed telegram_username_lower column (see migrations/)
+    lookups = [(user_id, (username or '').lower()) for user_id, username in lookups]
+    user_ids = list({user_id for user_id, _ in lookups if user_id})
+    usernames = list({username for _, username in lookups if username})
+    
+    if db_pool:
+        # One branch per key rather than an OR, so each is an index-only scan
+        # of its covering index (see migrations/005)
+        rows = await db_pool.fetch(
+            "SELECT amount_paid, telegram_user_id, telegram_username_lower FROM subscriptions "
+            "WHERE telegram_user_id = ANY($1::bigint[]) "
+            "AND payment_status = 'completed' AND is_active "
+            "AND amount_paid::text = ANY($3::text[]) "
+            "UNION ALL "
+            "SELECT amount_paid, telegram_user_id, telegram_username_lower FROM subscriptions "
+            "WHERE telegram_username_lower = ANY($2::text[]) "
+            "AND payment_status = 'completed' AND is_active "
+            "AND amount_paid::text = ANY($3::text[])",
+            user_ids, usernames, PAYMENT_AMOUNTS
+        )
+    else:
+        conditions = []
+        if user_ids:
+            conditions.append(f"telegram_user_id.in.({','.join(map(str, user_ids))})")
+        if usernames:
+            quoted = ','.join(f'"{username}"' for username in usernames)
+            conditions.append(f"telegram_username_lower.in.({quoted})")
+        if not conditions:
+            return [(False, None, None)] * len(lookups)
+        
+        response = await supabase_http.get("/subscriptions", params={
+            "select": "amount_paid,telegram_user_id,telegram_username_lower",
+            "or": f"({','.join(conditions)})",
+            "payment_status": "eq.completed",
+            "is_active": "eq.true",
+            "amount_paid": f"in.({','.join(PAYMENT_AMOUNTS)})"
+        })
+        response.raise_for_status()
+        rows = parse_json(response.content)
+    
+    by_user_id = {}
+    by_username = {}
+    for row in rows:
+        if str(row['amount_paid']) not in PAYMENT_CHANNELS:
+            # An unexpected amount (e.g. 49.0 over REST) only fails its own lookup
+            continue
+        if row['telegram_user_id'] is not None:
+            by_user_id.setdefault(row['telegram_user_id'], row)
+        by_username.setdefault(row['telegram_username_lower'], []).append(row)
+    
+    # Only rows with a known plan amount were kept, so any match maps
+    # straight to its channel
+    results = []
+    for user_id, username in lookups:
+        row = by_user_id.get(user_id) if user_id else None
+        if row is None and username:
+            # A username only vouches for rows not yet bound to another
+            # account, so a recycled username cannot inherit a subscription.
+            # /invite looks up by username alone (user_id 0) and accepts any.
+            row = next((
+                candidate for candidate in by_username.get(username, ())
+                if not user_id or candidate['telegram_user_id'] is None
+            ), None)
+        if row is None:
+            results.append((False, None, None))
+            continue
         
+        if user_id and row['telegram_user_id'] is None:
+            # Matched by username only: bind the row to the numeric id so
+            # later lookups survive username changes
+            spawn_background(backfill_user_id(user_id, username))
+        amount = str(row['amount_paid'])
+        results.append((True, amount, PAYMENT_CHANNELS[amount]))
+    return results
+
+async def backfill_user_id(user_id: int, username: str):
+    """Store a user's Telegram id on their username-matched active subscription rows"""
+    try:
+        if db_pool:
+            await db_pool.execute(
+                "UPDATE subscriptions SET telegram_user_id = $1 "
+                "WHERE telegram_username_lower = $2 AND telegram_user_id IS NULL "
+                "AND is_active AND payment_status = 'completed'",
+                user_id, username
+            )
+        else:
+            response = await supabase_http.patch(
+                "/subscriptions",
+                params={
+                    "telegram_username_lower": f"eq.{username}",
+                    "telegram_user_id": "is.null",
+                    "is_active": "eq.true",
+                    "payment_status": "eq.completed"
+                },
+                json={"telegram_user_id": user_id},
+                headers={"Prefer": "return=minimal"}
+            )
+            response.raise_for_status()
+        logger.info("Stored user id %s for %s", user_id, username)
     except Exception as e:
-        logger.error(f"Error checking subscription: {e}")
-        return False, None, None
+        logger.error("Error storing user id for %s: %s", username, e)
+
+def spawn_background(coro):
+    """Run a coroutine in the background, keeping a reference until it ends"""
+    task = asyncio.get_running_loop().create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+async def bot_call(method, *args, timeout: float = BOT_CALL_TIMEOUT, tries: int = BOT_CALL_TRIES, **kwargs):
+    """Call a Bot API method with an HTTP timeout, retrying transient failures with backoff"""
+    for attempt in range(tries):
+        try:
+            return await method(*args, read_timeout=timeout, write_timeout=timeout, **kwargs)
+        except BadRequest:
+            # Permanent failure - retrying would get the same answer
+            raise
+        except NetworkError:
+            if attempt == tries - 1:
+                raise
+            await asyncio.sleep(0.2 * 2 ** attempt + random.random() * 0.1)
 
 async def handle_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle new chat members - SILENT approval only"""
     try:
         chat_member = update.chat_member
-        chat_id = str(chat_member.chat.id)
-        user = chat_member.new_chat_member.user
-        user_id = user.id
-        username = user.username or f"user_{user_id}"
-        
-        if chat_id not in [CHANNEL_49_299, CHANNEL_79_399]:
-            return
         
+        # Only plain joins need verification; leaves, promotions, demotions
+        # and restriction changes - most updates - are dropped first
         old_status = chat_member.old_chat_member.status
         new_status = chat_member.new_chat_member.status
+        if (old_status, new_status) not in JOIN_TRANSITIONS:
+            return
         
-        if (old_status in ["left", "kicked", "restricted", "banned"] and 
-            new_status in ["member", "administrator", "creator"]):
-            
-            logger.info(f"User joining: {username} in {chat_id}")
-            
+        chat_id = chat_member.chat.id
+        if chat_id not in VALID_CHANNELS:
+            return
+        
+        user = chat_member.new_chat_member.user
+        user_id = user.id
+        username = user.username
+        
+        key = (chat_id, user_id)
+        pending = _pending_joins.get(key)
+        if pending:
+            # A newer join supersedes one still waiting out the debounce
+            pending.cancel()
+        _pending_joins[key] = context.application.create_task(
+            debounce_join(context.bot, chat_id, user_id, username)
+        )
+                
+    except Exception as e:
+        logger.error("Error in handle_chat_member: %s", e)
+
+async def debounce_join(bot: Bot, chat_id: int, user_id: int, username: Optional[str]):
+    """Verify a join once no newer join for the same user has arrived"""
+    key = (chat_id, user_id)
+    await asyncio.sleep(JOIN_DEBOUNCE_SECONDS)
+    
+    # From here on the join is committed and can no longer be cancelled
+    if _pending_joins.get(key) is asyncio.current_task():
+        del _pending_joins[key]
+    await verify_join(bot, chat_id, user_id, username)
+
+async def verify_join(bot: Bot, chat_id: int, user_id: int, username: Optional[str]):
+    """Silently approve or kick a user who joined a paid channel"""
+    try:
+        logger.debug("User joining: %s (@%s) in %s", user_id, username, chat_id)
+        
+        async with _join_slots:
             has_subscription, amount, correct_channel_id = await check_user_subscription(user_id, username)
-            
-            if has_subscription:
-                if chat_id == correct_channel_id:
-                    # SILENT approval - no message
-                    try:
-                        await context.bot.unban_chat_member(
-                            chat_id=chat_id,
-                            user_id=user_id,
-                            only_if_banned=True
-                        )
-                        logger.info(f"Approved user {username}")
-                    except:
-                        logger.info(f"User {username} already not banned")
-                else:
-                    # Wrong channel - silent kick
-                    try:
-                        await context.bot.ban_chat_member(chat_id=chat_id, user_id=user_id)
-                        logger.info(f"Kicked {username} from wrong channel")
-                    except Exception as e:
-                        logger.error(f"Error kicking user: {e}")
+        
+        if has_subscription is None:
+            # Lookup failed - remove the user without banning so a paying
+            # user can simply join again once Supabase answers
+            logger.warning("Subscription of %s (@%s) unknown, removing without ban", user_id, username)
+            try:
+                await bot_call(bot.ban_chat_member, chat_id=chat_id, user_id=user_id)
+            except TelegramError as e:
+                logger.error("Missed removal of %s (@%s) from %s: %s", user_id, username, chat_id, e)
+                return
+            try:
+                await bot_call(bot.unban_chat_member, chat_id=chat_id, user_id=user_id, only_if_banned=True)
+            except TelegramError as e:
+                # The user is now banned, which this branch must not do -
+                # an admin has to lift it by hand
+                logger.error("User %s (@%s) left banned in %s after failed unban: %s", user_id, username, chat_id, e)
+        elif has_subscription:
+            if chat_id == correct_channel_id:
+                # SILENT approval - the user is already a member, so
+                # there is no ban to lift and no API call to make
+                logger.info("Approved user %s (@%s)", user_id, username)
             else:
-                # No subscription - silent kick
+                # Wrong channel - silent kick
                 try:
-                    await context.bot.ban_chat_member(chat_id=chat_id, user_id=user_id)
-                    logger.info(f"Kicked {username} - no subscription")
-                except Exception as e:
-                    logger.error(f"Error kicking user: {e}")
-                    
+                    await bot_call(bot.ban_chat_member, chat_id=chat_id, user_id=user_id)
+                    logger.info("Kicked %s (@%s) from wrong channel", user_id, username)
+                except TelegramError as e:
+                    logger.error("Missed ban of %s (@%s) in %s: %s", user_id, username, chat_id, e)
+        else:
+            # No subscription - silent kick
+            try:
+                await bot_call(bot.ban_chat_member, chat_id=chat_id, user_id=user_id)
+                logger.info("Kicked %s (@%s) - no subscription", user_id, username)
+            except TelegramError as e:
+                logger.error("Missed ban of %s (@%s) in %s: %s", user_id, username, chat_id, e)
+                
     except Exception as e:
-        logger.error(f"Error in handle_chat_member: {e}")
+        logger.error("Error in verify_join: %s", e)
+
+async def get_channel_admins(context: ContextTypes.DEFAULT_TYPE, channel_id: int):
+    """Return the admin user ids of a channel, cached for ADMIN_CACHE_TTL"""
+    cached = _admin_cache.get(channel_id)
+    if cached and time.monotonic() - cached[0] < ADMIN_CACHE_TTL:
+        return cached[1]
+    
+    admins = await bot_call(context.bot.get_chat_administrators, chat_id=channel_id)
+    admin_ids = frozenset(admin.user.id for admin in admins)
+    _admin_cache[channel_id] = (time.monotonic(), admin_ids)
+    return admin_ids
+
+async def is_admin(context: ContextTypes.DEFAULT_TYPE, user_id: int):
+    """Check if user is an admin of either paid channel"""
+    channels = list(VALID_CHANNELS)
+    # Both channels are fetched concurrently on a cache miss
+    results = await asyncio.gather(
+        *(get_channel_admins(context, channel_id) for channel_id in channels),
+        return_exceptions=True
+    )
+    
+    for channel_id, admin_ids in zip(channels, results):
+        if isinstance(admin_ids, Exception):
+            logger.error("Error fetching admins of %s: %s", channel_id, admin_ids)
+        elif user_id in admin_ids:
+            return True
+    return False
 
 async def manual_approve(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Manual approval command for admins"""
     try:
+        if not await is_admin(context, update.effective_user.id):
+            await update.message.reply_text(ADMINS_ONLY_MSG)
+            return
+            
         if not update.message.reply_to_message:
-            await update.message.reply_text("Reply to a user's message with /approve")
+            await update.message.reply_text(APPROVE_USAGE_MSG)
             return
             
         user_to_approve = update.message.reply_to_message.from_user
         user_id = user_to_approve.id
         username = user_to_approve.username or f"user_{user_id}"
-        channel_id = str(update.message.chat_id)
+        channel_id = update.message.chat_id
         
         try:
-            await context.bot.unban_chat_member(
+            await bot_call(
+                context.bot.unban_chat_member,
                 chat_id=channel_id,
                 user_id=user_id,
                 only_if_banned=True
             )
-            logger.info(f"Manually approved {username}")
-            await update.message.reply_text(f"✅ User @{username} approved.")
-        except Exception as e:
-            await update.message.reply_text(f"Error: {e}")
+            invalidate_subscription_cache(user_id, user_to_approve.username)
+            logger.info("Manually approved %s", username)
+            await update.message.reply_text(APPROVED_TMPL(username=username))
+        except TelegramError as e:
+            await update.message.reply_text(ERROR_TMPL(error=e))
             
     except Exception as e:
-        logger.error(f"Error in manual_approve: {e}")
+        logger.error("Error in manual_approve: %s", e)
+
+async def get_invite_link(bot: Bot, channel_id: int):
+    """Return the channel's shared invite link, creating one when it nears expiry"""
+    cached = _invite_cache.get(channel_id)
+    if cached and time.monotonic() < cached[0]:
+        return cached[1]
+    
+    invite_link = await bot_call(
+        bot.create_chat_invite_link,
+        chat_id=channel_id,
+        expire_date=int(time.time()) + INVITE_LINK_LIFETIME,
+        creates_join_request=False
+    )
+    _invite_cache[channel_id] = (time.monotonic() + INVITE_CACHE_TTL, invite_link.invite_link)
+    return invite_link.invite_link
 
 async def generate_invite(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Generate invite link for a user"""
     try:
+        if not await is_admin(context, update.effective_user.id):
+            await update.message.reply_text(ADMINS_ONLY_MSG)
+            return
+            
         if not context.args:
-            await update.message.reply_text("Use: /invite @username")
+            await update.message.reply_text(INVITE_USAGE_MSG)
             return
             
         username = context.args[0].replace('@', '')
+        if not USERNAME_RE.match(username):
+            await update.message.reply_text(INVITE_USAGE_MSG)
+            return
         
         has_subscription, amount, channel_id = await check_user_subscription(0, username)
         
-        if has_subscription:
+        if has_subscription is None:
+            await update.message.reply_text(INVITE_ERROR_MSG)
+        elif has_subscription:
             try:
-                invite_link = await context.bot.create_chat_invite_link(
-                    chat_id=channel_id,
-                    name=f"Invite for {username}",
-                    creates_join_request=False
-                )
-                await update.message.reply_text(f"✅ Invite for @{username}: {invite_link.invite_link}")
-                logger.info(f"Generated invite for @{username}")
-            except Exception as e:
-                await update.message.reply_text("Error generating invite.")
+                invite_link = await get_invite_link(context.bot, channel_id)
+                await update.message.reply_text(INVITE_TMPL(username=username, link=invite_link))
+                logger.info("Generated invite for @%s", username)
+            except TelegramError:
+                await update.message.reply_text(INVITE_ERROR_MSG)
         else:
-            await update.message.reply_text(f"❌ No subscription found for @{username}.")
+            await update.message.reply_text(NO_SUBSCRIPTION_TMPL(username=username))
             
     except Exception as e:
-        await update.message.reply_text("Error generating invite.")
+        await update.message.reply_text(INVITE_ERROR_MSG)
 
 async def check_subscription(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Check subscription status"""
     try:
         user = update.message.from_user
-        user_id = user.id
-        username = user.username or f"user_{user_id}"
+        has_subscription, amount, channel_id = await check_user_subscription(user.id, user.username)
         
-        has_subscription, amount, channel_id = await check_user_subscription(user_id, username)
-        
-        if has_subscription:
-            channel_name = "49/299" if channel_id == CHANNEL_49_299 else "79/399"
-            await update.message.reply_text(f"✅ Active subscription! (₹{amount}) for {channel_name} channel.")
+        if has_subscription is None:
+            await update.message.reply_text(CHECK_ERROR_MSG)
+        elif has_subscription:
+            await update.message.reply_text(
+                ACTIVE_SUBSCRIPTION_TMPL(amount=amount, channel=CHANNEL_NAMES.get(channel_id, "?"))
+            )
         else:
-            await update.message.reply_text("❌ No active subscription found.")
+            await update.message.reply_text(NO_ACTIVE_SUBSCRIPTION_MSG)
             
     except Exception as e:
-        await update.message.reply_text("Error checking subscription.")
+        await update.message.reply_text(CHECK_ERROR_MSG)
 
-def main():
-    """Start the bot"""
-    required_vars = ['TELEGRAM_BOT_TOKEN', 'CHANNEL_49_299_ID', 'CHANNEL_79_399_ID']
-    for var in required_vars:
-        if not os.environ.get(var):
-            logger.error(f"Missing environment variable: {var}")
+# Bot commands, dispatched by dispatch_command
+COMMANDS = {
+    "approve": manual_approve,
+    "invite": generate_invite,
+    "check": check_subscription
+}
+
+async def dispatch_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Route a /command to its handler with a single dict lookup"""
+    if not update.message or not update.message.text:
+        return
+    
+    parts = update.message.text.split()
+    command, _, bot_username = parts[0][1:].partition('@')
+    # Ignore commands addressed to another bot, e.g. /check@OtherBot
+    if bot_username and bot_username.lower() != context.bot.username.lower():
+        return
+    
+    handler = COMMANDS.get(command.lower())
+    if handler:
+        context.args = parts[1:]
+        await handler(update, context)
+
+def parse_json(payload: bytes):
+    """Decode a JSON payload, with orjson when available"""
+    if orjson_available:
+        return orjson.loads(payload)
+    return json.loads(payload)
+
+class BotRequest(HTTPXRequest):
+    """HTTPXRequest that decodes Bot API responses with orjson when available"""
+    
+    @staticmethod
+    def parse_json_payload(payload: bytes):
+        if orjson_available:
+            try:
+                return orjson.loads(payload)
+            except orjson.JSONDecodeError:
+                # Let the stdlib path handle undecodable payloads
+                pass
+        return HTTPXRequest.parse_json_payload(payload)
+
+async def open_clients(application: Application):
+    """Open the database clients once the event loop is running"""
+    global supabase_http
+    subscription_batcher.start()
+    
+    if asyncpg_available and CONFIG.supabase_db_url:
+        await open_db_pool()
+    
+    if not db_pool and CONFIG.supabase_url and CONFIG.supabase_key:
+        supabase_http = httpx.AsyncClient(
+            base_url=f"{CONFIG.supabase_url.rstrip('/')}/rest/v1",
+            headers={"apikey": CONFIG.supabase_key, "Authorization": f"Bearer {CONFIG.supabase_key}"},
+            http2=True,
+            timeout=SUBSCRIPTION_QUERY_TIMEOUT,
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=50)
+        )
+        logger.info("Supabase REST client initialized")
+
+async def open_db_pool(tries: int = DB_CONNECT_TRIES):
+    """Open the Postgres connection pool, retrying with backoff"""
+    global db_pool
+    for attempt in range(tries):
+        try:
+            # statement_cache_size=0 keeps prepared statements off, which the
+            # Supavisor pooler in transaction mode requires
+            db_pool = await asyncpg.create_pool(
+                dsn=CONFIG.supabase_db_url,
+                min_size=5,
+                max_size=20,
+                statement_cache_size=0
+            )
+            logger.info("Postgres connection pool initialized")
             return
+        except Exception as e:
+            logger.error("Failed to initialize Postgres pool: %s", e)
+            if attempt == tries - 1:
+                # Fail startup rather than run without a database - the
+                # no-Supabase fallback would approve every joiner
+                raise
+            await asyncio.sleep(2 ** attempt)
+
+async def close_clients(application: Application):
+    """Close the shared database connections on shutdown"""
+    await subscription_batcher.stop()
     
-    application = Application.builder().token(BOT_TOKEN).build()
+    if db_pool:
+        await db_pool.close()
     
+    if supabase_http:
+        await supabase_http.aclose()
+
+def register_handlers(application: Application):
+    """Attach the join and command handlers to an application"""
     application.add_handler(ChatMemberHandler(handle_chat_member, ChatMemberHandler.CHAT_MEMBER))
-    application.add_handler(CommandHandler("approve", manual_approve))
-    application.add_handler(CommandHandler("invite", generate_invite))
-    application.add_handler(CommandHandler("check", check_subscription))
+    application.add_handler(MessageHandler(filters.COMMAND, dispatch_command))
+
+def main():
+    """Start the bot"""
+    log_listener.start()
+    atexit.register(log_listener.stop)
     
-    logger.info("Bot starting - silent approval only")
+    missing_vars = CONFIG.missing()
+    for var in missing_vars:
+        logger.error("Missing environment variable: %s", var)
+    if missing_vars:
+        return
     
-    application.run_polling(
-        allowed_updates=[Update.CHAT_MEMBER, Update.MESSAGE],
-        drop_pending_updates=True
-    )
+    if uvloop_available:
+        # Must be set before the Application creates its event loop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        logger.info("Using uvloop event loop")
+    
+    # Telegram's 20-per-minute group limit applies to sent messages, not to
+    # bans, so only the global rate is throttled; a 429 is still retried
+    application = Application.builder() \
+        .token(CONFIG.bot_token) \
+        .request(BotRequest(connection_pool_size=64, http_version="2")) \
+        .get_updates_request(BotRequest(http_version="2")) \
+        .rate_limiter(AIORateLimiter(overall_max_rate=28, group_max_rate=0, max_retries=3)) \
+        .post_init(open_clients) \
+        .post_shutdown(close_clients) \
+        .build()
+    
+    register_handlers(application)
+    
+    if CONFIG.webhook_url:
+        # A public HTTPS endpoint is available: let Telegram push updates.
+        # The built-in server acknowledges each POST as soon as the update
+        # is queued, so slow handlers never delay Telegram's delivery.
+        logger.info("Bot starting - silent approval only (webhook)")
+        application.run_webhook(
+            listen="0.0.0.0",
+            port=CONFIG.port,
+            url_path=CONFIG.bot_token,
+            webhook_url=f"{CONFIG.webhook_url}/{CONFIG.bot_token}",
+            secret_token=CONFIG.webhook_secret,
+            allowed_updates=ALLOWED_UPDATES,
+            drop_pending_updates=True
+        )
+    else:
+        logger.info("Bot starting - silent approval only (polling)")
+        # Long polling: each getUpdates waits up to 30s for new updates
+        application.run_polling(
+            timeout=30,
+            bootstrap_retries=-1,
+            allowed_updates=ALLOWED_UPDATES,
+            drop_pending_updates=True
+        )
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,10 @@
+-- Subscription lookups match on the Telegram user id or the exact username
+-- instead of an ILIKE '%username%' scan.
+
+ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS telegram_user_id bigint;
+
+CREATE INDEX IF NOT EXISTS subscriptions_telegram_username_idx
+    ON subscriptions (telegram_username);
+
+CREATE INDEX IF NOT EXISTS subscriptions_telegram_user_id_idx
+    ON subscriptions (telegram_user_id);
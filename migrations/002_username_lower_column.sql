@@ -0,0 +1,12 @@
+-- Postgres maintains the normalised username itself, so lookups no longer
+-- depend on how the username was written on insert.
+ALTER TABLE subscriptions
+    ADD COLUMN IF NOT EXISTS telegram_username_lower text
+    GENERATED ALWAYS AS (lower(ltrim(telegram_username, '@'))) STORED;
+
+-- Only live subscriptions are ever looked up, so index just those rows
+CREATE INDEX IF NOT EXISTS subscriptions_active_username_lower_idx
+    ON subscriptions (telegram_username_lower)
+    WHERE is_active AND payment_status = 'completed';
+
+DROP INDEX IF EXISTS subscriptions_telegram_username_idx;
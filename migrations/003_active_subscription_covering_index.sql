@@ -0,0 +1,15 @@
+-- Covering partial index for the original read pattern:
+--   telegram_username_lower = ? AND is_active AND payment_status = 'completed'
+-- returning amount_paid. INCLUDE lets Postgres answer it with an index-only
+-- scan. Superseded by 005 once lookups also returned the user id.
+-- CONCURRENTLY cannot run inside a transaction block.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_subs_active_user
+    ON subscriptions (telegram_username_lower)
+    INCLUDE (amount_paid)
+    WHERE is_active AND payment_status = 'completed';
+
+-- Superseded by the covering index above
+DROP INDEX CONCURRENTLY IF EXISTS subscriptions_active_username_lower_idx;
+
+-- Refresh the visibility map so index-only scans can skip heap fetches
+VACUUM (ANALYZE) subscriptions;
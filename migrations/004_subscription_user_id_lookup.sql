@@ -0,0 +1,12 @@
+-- Lookups try the immutable Telegram user id first. The bot backfills
+-- telegram_user_id the first time a row is matched by username.
+--
+-- The column is not UNIQUE: a user can hold several subscription rows
+-- (renewals, plan changes).
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_subs_active_user_id
+    ON subscriptions (telegram_user_id)
+    INCLUDE (amount_paid)
+    WHERE is_active AND payment_status = 'completed';
+
+-- Superseded by the partial covering index above
+DROP INDEX CONCURRENTLY IF EXISTS subscriptions_telegram_user_id_idx;
@@ -0,0 +1,21 @@
+-- The batched lookup selects amount_paid, telegram_user_id and
+-- telegram_username_lower, matching on either id or username. Each partial
+-- index now INCLUDEs every selected column so both branches of the query are
+-- answered by index-only scans. CONCURRENTLY cannot run inside a
+-- transaction block.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_subs_active_username_covering
+    ON subscriptions (telegram_username_lower)
+    INCLUDE (amount_paid, telegram_user_id)
+    WHERE is_active AND payment_status = 'completed';
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_subs_active_user_id_covering
+    ON subscriptions (telegram_user_id)
+    INCLUDE (amount_paid, telegram_username_lower)
+    WHERE is_active AND payment_status = 'completed';
+
+-- Superseded by the covering indexes above
+DROP INDEX CONCURRENTLY IF EXISTS idx_subs_active_user;
+DROP INDEX CONCURRENTLY IF EXISTS idx_subs_active_user_id;
+
+-- Refresh the visibility map so index-only scans can skip heap fetches
+VACUUM (ANALYZE) subscriptions;